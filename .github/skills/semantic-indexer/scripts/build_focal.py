@@ -5,10 +5,11 @@ Uses query_repo.py for tree-sitter parsing and call graph building
 """
 
 import argparse
+import contextlib
 import sys
 import os
 from pathlib import Path
-from typing import Dict, Set
+from typing import Dict
 
 # Add scripts directory to path
 sys.path.insert(0, str(Path(__file__).parent))
@@ -19,46 +20,68 @@ from indexer import SemanticIndex
 
 def walk_call_graph(graph: Dict, func_map: Dict[tuple, int], index: SemanticIndex) -> int:
     """
-    Recursively walk nested call graph and populate database
+    Walk nested call graph (pre-order, explicit stack) and populate database
+    Rows are not committed; the caller commits once after the walk
+    Functions shared by several callers are walked once (tracked in func_map)
     Returns function_id of root, or -1 if function has unknown file path
     """
-    func_name = graph["function"]
-    file_path = graph.get("file", "unknown")
-    start_line = graph.get("start_line", 0)
-    end_line = graph.get("end_line", 0)
-    
-    # Skip functions with unknown file paths (external/system functions)
-    if file_path == "unknown":
-        return -1
-    
-    # Add function to DB
-    func_id = index.add_function(func_name, file_path, start_line, end_line)
-    func_map[(func_name, file_path)] = func_id
-    
-    # Recursively process callees
-    calls = graph.get("calls", [])
-    if isinstance(calls, str):
-        # Handle "Already visited (cycle)" case
-        return func_id
-    
-    for callee_graph in calls:
-        callee_id = walk_call_graph(callee_graph, func_map, index)
-        # Add call edge only if callee was added to DB
-        if callee_id != -1:
-            index.add_call_edge(func_id, callee_id)
-    
-    return func_id
+    root_id = -1
+    # (graph node, caller function_id or None for the root)
+    stack = [(graph, None)]
+    while stack:
+        node, caller_id = stack.pop()
+        func_name = node["function"]
+        file_path = node.get("file", "unknown")
+        
+        # Skip functions with unknown file paths (external/system functions)
+        if file_path == "unknown":
+            continue
+        
+        func_id = func_map.get((func_name, file_path))
+        is_new = func_id is None
+        if is_new:
+            # Add function to DB
+            func_id = index.add_function(
+                func_name, file_path, node.get("start_line", 0), node.get("end_line", 0), commit=False
+            )
+            func_map[(func_name, file_path)] = func_id
+        
+        if caller_id is None:
+            root_id = func_id
+        else:
+            index.add_call_edge(caller_id, func_id, commit=False)
+        
+        # Already added through another caller (or a cycle)
+        if not is_new:
+            continue
+        
+        calls = node.get("calls", [])
+        if isinstance(calls, str):
+            # Handle "Already visited (cycle)" case
+            continue
+        
+        # Reversed so callees are visited in order
+        for callee_graph in reversed(calls):
+            stack.append((callee_graph, func_id))
+    
+    return root_id
 
 
 def count_functions_in_graph(graph: Dict) -> int:
-    """Count total functions in nested call graph (excludes unknown file paths)"""
-    file_path = graph.get("file", "unknown")
-    count = 0 if file_path == "unknown" else 1
-    calls = graph.get("calls", [])
-    if isinstance(calls, str):
-        return count
-    for callee in calls:
-        count += count_functions_in_graph(callee)
+    """Count distinct functions in nested call graph (excludes unknown file paths)"""
+    count = 0
+    seen = set()
+    stack = [graph]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if node.get("file", "unknown") != "unknown":
+            count += 1
+        calls = node.get("calls", [])
+        if not isinstance(calls, str):
+            stack.extend(calls)
     return count
 
 
@@ -101,16 +124,17 @@ def main():
     print(f"\nExtracted {func_count} functions from call graph")
     
     # Initialize database
-    index = SemanticIndex(args.db)
-    index.init_schema()
-    
-    # Walk graph and populate DB
-    print(f"\nAdding to database: {args.db}")
-    func_map = {}
-    walk_call_graph(call_graph, func_map, index)
-    
-    # Get stats
-    stats = index.get_stats()
+    with contextlib.closing(SemanticIndex(args.db)) as index:
+        index.init_schema()
+        
+        # Walk graph and populate DB
+        print(f"\nAdding to database: {args.db}")
+        func_map = {}
+        walk_call_graph(call_graph, func_map, index)
+        index.conn.commit()
+        
+        # Get stats
+        stats = index.get_stats()
     
     print(f"\nComplete!")
     print(f"  Functions in DB: {stats['total_functions']}")
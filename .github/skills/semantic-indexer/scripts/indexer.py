@@ -3,22 +3,164 @@
 Core semantic index with SQLite storage
 """
 
+import contextlib
 import sqlite3
+import sys
 import json
 import argparse
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 
 
+# Shared by indexer and summarizer so each statement is prepared once per
+# connection (sqlite3 caches compiled statements keyed by the SQL text)
+SQL_PRECONDITIONS = """
+    SELECT condition_text FROM preconditions
+    WHERE function_id = ? ORDER BY sequence_order
+"""
+
+SQL_POSTCONDITIONS = """
+    SELECT condition_text FROM postconditions
+    WHERE function_id = ? ORDER BY sequence_order
+"""
+
+SQL_CALLEES = """
+    SELECT f.function_id, f.name, f.file, f.summary
+    FROM call_edges ce
+    JOIN functions f ON ce.callee_id = f.function_id
+    WHERE ce.caller_id = ?
+    ORDER BY ce.callee_id
+"""
+
+SQL_FUNCTION_ID_BY_NAME = "SELECT function_id FROM functions WHERE name = ? LIMIT 1"
+
+# Recount of functions.unsummarized_callee_count from call_edges
+SQL_RECOUNT_UNSUMMARIZED_CALLEES = """
+    UPDATE functions SET unsummarized_callee_count = (
+        SELECT COUNT(*) FROM call_edges ce
+        JOIN functions c ON c.function_id = ce.callee_id
+        WHERE ce.caller_id = functions.function_id
+          AND ce.callee_id != ce.caller_id
+          AND c.summary = ''
+    )
+"""
+
+# Keep unsummarized_callee_count in step with call_edges and summaries inside
+# the writing statement itself, so concurrent writers and raw SQL can't skew it
+COUNTER_TRIGGERS = {
+    "trg_call_edge_insert": """
+        CREATE TRIGGER IF NOT EXISTS trg_call_edge_insert
+        AFTER INSERT ON call_edges
+        WHEN NEW.caller_id != NEW.callee_id
+         AND (SELECT summary FROM functions WHERE function_id = NEW.callee_id) = ''
+        BEGIN
+            UPDATE functions
+            SET unsummarized_callee_count = unsummarized_callee_count + 1
+            WHERE function_id = NEW.caller_id;
+        END
+    """,
+    "trg_call_edge_delete": """
+        CREATE TRIGGER IF NOT EXISTS trg_call_edge_delete
+        AFTER DELETE ON call_edges
+        WHEN OLD.caller_id != OLD.callee_id
+         AND (SELECT summary FROM functions WHERE function_id = OLD.callee_id) = ''
+        BEGIN
+            UPDATE functions
+            SET unsummarized_callee_count = unsummarized_callee_count - 1
+            WHERE function_id = OLD.caller_id;
+        END
+    """,
+    "trg_function_delete": """
+        CREATE TRIGGER IF NOT EXISTS trg_function_delete
+        BEFORE DELETE ON functions
+        WHEN OLD.summary = ''
+        BEGIN
+            -- The cascaded call_edges deletes can no longer see this row
+            UPDATE functions
+            SET unsummarized_callee_count = unsummarized_callee_count - 1
+            WHERE function_id IN (
+                SELECT caller_id FROM call_edges
+                WHERE callee_id = OLD.function_id AND caller_id != OLD.function_id
+            );
+        END
+    """,
+    "trg_function_summary_update": """
+        CREATE TRIGGER IF NOT EXISTS trg_function_summary_update
+        AFTER UPDATE OF summary ON functions
+        WHEN (OLD.summary = '') != (NEW.summary = '')
+        BEGIN
+            UPDATE functions
+            SET unsummarized_callee_count =
+                unsummarized_callee_count + (CASE WHEN NEW.summary = '' THEN 1 ELSE -1 END)
+            WHERE function_id IN (
+                SELECT caller_id FROM call_edges
+                WHERE callee_id = NEW.function_id AND caller_id != NEW.function_id
+            );
+        END
+    """,
+}
+
+
 class SemanticIndex:
     """Normalized semantic index with call graph storage"""
     
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        # Room for the per-chunk IN (...) variants of get_callees_bulk as well
+        self.conn = sqlite3.connect(db_path, cached_statements=256)
+        # WAL + NORMAL sync: commits don't fsync (crash-safe, may lose only the last txn)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.execute("PRAGMA mmap_size = 268435456")
+        self.conn.execute("PRAGMA cache_size = -65536")
+        self.conn.execute("PRAGMA busy_timeout = 5000")
         self.conn.execute("PRAGMA foreign_keys = ON")
         self.conn.row_factory = sqlite3.Row
+        self._migrate_schema()
+    
+    def close(self):
+        """Refresh planner stats, checkpoint what the WAL allows without waiting, and close"""
+        self.conn.execute("PRAGMA optimize")
+        # PASSIVE never blocks on other connections' readers; TRUNCATE would
+        # sit out busy_timeout whenever a next-batch worker or serve session is open
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        self.conn.close()
+    
+    def _migrate_schema(self):
+        """
+        Bring databases created before unsummarized_callee_count (or its
+        triggers) existed up to date, recounting the column from call_edges
+        """
+        def needs_migration():
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(functions)")}
+            if not columns:
+                return False  # Fresh database; init_schema creates everything
+            triggers = {row[0] for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+            )}
+            return "unsummarized_callee_count" not in columns or not COUNTER_TRIGGERS.keys() <= triggers
         
+        if not needs_migration():
+            return
+        with self.conn:
+            # Take the write lock first, then re-check in case another process migrated
+            self.conn.execute("BEGIN IMMEDIATE")
+            if not needs_migration():
+                return
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(functions)")}
+            if "unsummarized_callee_count" not in columns:
+                self.conn.execute(
+                    "ALTER TABLE functions ADD COLUMN unsummarized_callee_count INTEGER NOT NULL DEFAULT 0"
+                )
+            self.conn.execute(SQL_RECOUNT_UNSUMMARIZED_CALLEES)
+            self.conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ready_functions
+                ON functions(unsummarized_callee_count, function_id) WHERE summary = ''
+            """)
+            for trigger_sql in COUNTER_TRIGGERS.values():
+                self.conn.execute(trigger_sql)
+    
     def init_schema(self):
         """Initialize database schema"""
         self.conn.executescript("""
@@ -29,6 +171,8 @@ class SemanticIndex:
                 start_line INTEGER,
                 end_line INTEGER,
                 summary TEXT DEFAULT '',
+                -- Callees (other than itself) with no summary yet; 0 means ready to summarize
+                unsummarized_callee_count INTEGER NOT NULL DEFAULT 0,
                 UNIQUE(name, file)
             );
             
@@ -62,7 +206,9 @@ class SemanticIndex:
             CREATE INDEX IF NOT EXISTS idx_func_file ON functions(file);
             CREATE INDEX IF NOT EXISTS idx_callees ON call_edges(caller_id);
             CREATE INDEX IF NOT EXISTS idx_callers ON call_edges(callee_id);
-        """)
+            CREATE INDEX IF NOT EXISTS idx_ready_functions
+                ON functions(unsummarized_callee_count, function_id) WHERE summary = '';
+        """ + "".join(f"{trigger_sql};\n" for trigger_sql in COUNTER_TRIGGERS.values()))
         self.conn.commit()
     
     def add_function(
@@ -71,16 +217,18 @@ class SemanticIndex:
         file: str, 
         start_line: int = 0,
         end_line: int = 0,
-        summary: str = ""
+        summary: str = "",
+        commit: bool = True
     ) -> int:
-        """Add function, return function_id"""
+        """Add function, return function_id. Pass commit=False to batch inserts in one transaction."""
         try:
             cursor = self.conn.execute(
                 """INSERT INTO functions (name, file, start_line, end_line, summary) 
                    VALUES (?, ?, ?, ?, ?)""",
                 (name, file, start_line, end_line, summary)
             )
-            self.conn.commit()
+            if commit:
+                self.conn.commit()
             return cursor.lastrowid
         except sqlite3.IntegrityError:
             # Already exists
@@ -92,16 +240,20 @@ class SemanticIndex:
             row = cursor.fetchone()
             return row[0] if row else None
     
-    def add_call_edge(self, caller_id: int, callee_id: int):
-        """Record call relationship"""
+    def add_call_edge(self, caller_id: int, callee_id: int, commit: bool = True):
+        """
+        Record call relationship. Pass commit=False to batch inserts in one transaction.
+        trg_call_edge_insert bumps the caller's unsummarized_callee_count.
+        """
         try:
             self.conn.execute(
                 "INSERT INTO call_edges (caller_id, callee_id) VALUES (?, ?)",
                 (caller_id, callee_id)
             )
-            self.conn.commit()
         except sqlite3.IntegrityError:
             pass  # Edge already exists
+        if commit:
+            self.conn.commit()
     
     def get_function_info(self, function_id: int) -> Optional[Dict]:
         """Get function details"""
@@ -124,21 +276,20 @@ class SemanticIndex:
         }
     
     def update_summary(self, function_id: int, summary: str):
-        """Update function summary"""
-        self.conn.execute(
-            "UPDATE functions SET summary = ? WHERE function_id = ?",
-            (summary, function_id)
-        )
-        self.conn.commit()
+        """
+        Update function summary. trg_function_summary_update adjusts the
+        callers' unsummarized_callee_count in the same statement, against
+        the row as it is when the write lock is held.
+        """
+        with self.conn:
+            self.conn.execute(
+                "UPDATE functions SET summary = ? WHERE function_id = ?",
+                (summary, function_id)
+            )
     
     def get_callees(self, function_id: int) -> List[Dict]:
         """Get all callees with their summaries"""
-        cursor = self.conn.execute("""
-            SELECT f.function_id, f.name, f.file, f.summary
-            FROM call_edges ce
-            JOIN functions f ON ce.callee_id = f.function_id
-            WHERE ce.caller_id = ?
-        """, (function_id,))
+        cursor = self.conn.execute(SQL_CALLEES, (function_id,))
         
         return [
             {
@@ -150,45 +301,79 @@ class SemanticIndex:
             for row in cursor
         ]
     
+    def get_callees_bulk(self, function_ids: List[int]) -> Dict[int, List[Dict]]:
+        """get_callees for many functions with IN (...) queries; every requested id gets a list"""
+        callees_by_id = {func_id: [] for func_id in function_ids}
+        ids = list(callees_by_id)
+        # Stay under SQLite's default 999 bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor = self.conn.execute(f"""
+                SELECT ce.caller_id, f.function_id, f.name, f.file, f.summary
+                FROM call_edges ce
+                JOIN functions f ON ce.callee_id = f.function_id
+                WHERE ce.caller_id IN ({",".join("?" * len(chunk))})
+                ORDER BY ce.caller_id, ce.callee_id
+            """, chunk)
+            for row in cursor:
+                callees_by_id[row[0]].append({
+                    "function_id": row[1],
+                    "function": row[2],
+                    "file": row[3],
+                    "summary": row[4]
+                })
+        return callees_by_id
+    
     def get_function_tree(self, function_id: int, max_depth: Optional[int] = None) -> Dict:
         """Build nested tree of function with all callees"""
-        return self._build_tree(function_id, max_depth, 0, set())
+        return self._build_tree(function_id, max_depth, 0, set(), {})[0]
     
-    def _build_tree(self, func_id: int, max_depth: Optional[int], depth: int, visited: set) -> Dict:
-        """Recursive tree builder"""
-        if func_id in visited:
-            return {"cycle_detected": True}
+    def _build_tree(self, func_id: int, max_depth: Optional[int], depth: int,
+                    stack: set, memo: Dict) -> tuple:
+        """
+        Recursive tree builder.
+        
+        stack holds the ids on the current DFS path (cycle detection);
+        memo caches finished subtrees so shared callees in a DAG are
+        expanded once. A subtree that ran into a cycle marker depends on
+        the path taken to reach it and is not cached. Depth-limited walks
+        skip the memo: a truncated subtree can hide a back edge to a node
+        that is on the stack for a different caller.
+        
+        Returns (tree, hit_cycle).
+        """
+        if func_id in stack:
+            return {"cycle_detected": True}, True
         
         if max_depth is not None and depth >= max_depth:
-            return {"max_depth_reached": True}
+            return {"max_depth_reached": True}, False
         
-        visited.add(func_id)
+        if func_id in memo:
+            return memo[func_id], False
         
         func = self.get_function_info(func_id)
         if not func:
-            return {"error": "function not found"}
+            return {"error": "function not found"}, False
         
         # Get preconditions
-        cursor = self.conn.execute(
-            """SELECT condition_text FROM preconditions 
-               WHERE function_id = ? ORDER BY sequence_order""",
-            (func_id,)
-        )
+        cursor = self.conn.execute(SQL_PRECONDITIONS, (func_id,))
         preconditions = [row[0] for row in cursor]
         
         # Get postconditions
-        cursor = self.conn.execute(
-            """SELECT condition_text FROM postconditions 
-               WHERE function_id = ? ORDER BY sequence_order""",
-            (func_id,)
-        )
+        cursor = self.conn.execute(SQL_POSTCONDITIONS, (func_id,))
         postconditions = [row[0] for row in cursor]
         
         # Get callees
         callees = []
+        hit_cycle = False
+        stack.add(func_id)
         for callee in self.get_callees(func_id):
-            callee_tree = self._build_tree(callee["function_id"], max_depth, depth + 1, visited.copy())
+            callee_tree, callee_cycle = self._build_tree(
+                callee["function_id"], max_depth, depth + 1, stack, memo
+            )
             callees.append(callee_tree)
+            hit_cycle = hit_cycle or callee_cycle
+        stack.discard(func_id)
         
         result = {
             "function": func["name"],
@@ -205,23 +390,23 @@ class SemanticIndex:
         if callees:
             result["callees"] = callees
         
-        return result
+        if not hit_cycle and max_depth is None:
+            memo[func_id] = result
+        return result, hit_cycle
     
     def get_stats(self) -> Dict:
         """Database statistics"""
         stats = {}
         
-        cursor = self.conn.execute("SELECT COUNT(*) FROM functions")
-        stats["total_functions"] = cursor.fetchone()[0]
+        # Total and summarized counts in one scan
+        cursor = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(summary != ''), 0) FROM functions"
+        )
+        stats["total_functions"], stats["summarized_functions"] = cursor.fetchone()
         
         cursor = self.conn.execute("SELECT COUNT(*) FROM call_edges")
         stats["total_call_edges"] = cursor.fetchone()[0]
         
-        cursor = self.conn.execute(
-            "SELECT COUNT(*) FROM functions WHERE summary != ''"
-        )
-        stats["summarized_functions"] = cursor.fetchone()[0]
-        
         cursor = self.conn.execute("""
             SELECT COUNT(*) FROM functions
             WHERE function_id NOT IN (SELECT DISTINCT caller_id FROM call_edges)
@@ -257,45 +442,41 @@ def main():
         parser.print_help()
         return
     
-    index = SemanticIndex(args.db)
-    
-    if args.command == "init":
-        index.init_schema()
-        print(f"Initialized: {args.db}")
+    with contextlib.closing(SemanticIndex(args.db)) as index:
+        if args.command == "init":
+            index.init_schema()
+            print(f"Initialized: {args.db}")
     
-    elif args.command == "query":
-        # Find function
-        cursor = index.conn.execute(
-            "SELECT function_id FROM functions WHERE name = ? LIMIT 1",
-            (args.focal,)
-        )
-        row = cursor.fetchone()
+        elif args.command == "query":
+            # Find function
+            cursor = index.conn.execute(SQL_FUNCTION_ID_BY_NAME, (args.focal,))
+            row = cursor.fetchone()
         
-        if not row:
-            print(f"Function not found: {args.focal}")
-            return
+            if not row:
+                print(f"Function not found: {args.focal}")
+                return
         
-        func_id = row[0]
-        tree = index.get_function_tree(func_id, args.depth)
+            func_id = row[0]
+            tree = index.get_function_tree(func_id, args.depth)
         
-        if args.output:
-            with open(args.output, "w") as f:
-                json.dump(tree, f, indent=2)
-            print(f"Wrote to: {args.output}")
-        else:
-            print(json.dumps(tree, indent=2))
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(tree, f, indent=2)
+                print(f"Wrote to: {args.output}")
+            else:
+                print(json.dumps(tree, indent=2))
     
-    elif args.command == "stats":
-        stats = index.get_stats()
-        print("Database Statistics:")
-        for key, value in stats.items():
-            print(f"  {key}: {value}")
+        elif args.command == "stats":
+            stats = index.get_stats()
+            print("Database Statistics:")
+            for key, value in stats.items():
+                print(f"  {key}: {value}")
     
-    elif args.command == "list":
-        cursor = index.conn.execute("SELECT name, file FROM functions ORDER BY name")
-        print("Functions in database:")
-        for row in cursor:
-            print(f"  {row[0]} ({row[1]})")
+        elif args.command == "list":
+            cursor = index.conn.execute("SELECT name, file FROM functions ORDER BY name")
+            lines = ["Functions in database:"]
+            lines.extend(f"  {row[0]} ({row[1]})" for row in cursor)
+            sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":
@@ -3,8 +3,12 @@ import json
 import sys
 import pickle
 import hashlib
-from collections import deque
-from typing import Dict, List, Optional, Tuple
+import re
+import functools
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import tree_sitter
 from tree_sitter import Language
 
@@ -25,25 +29,44 @@ EXT_TO_LANGUAGE: Dict[str, str] = {
     ".cxx": "cpp",
 }
 
+# Extensions picked up by the project walk (and its cache fingerprint).
+INDEXED_EXTENSIONS = frozenset({".c", ".h", ".w", ".cpp", ".hpp", ".py"})
+
 PARSERS: Dict[str, tree_sitter.Parser] = {}
 
+# SAL annotation macros (e.g. _Ret_maybenull_, _In_reads_) that tree-sitter can
+# mistake for a function name in C declarators.
+_SAL_KEYWORD_RE = re.compile(r"_(?:Ret|Post|Pre|In|Out|Check|Frees)_")
+
+# Type names that can show up as bare identifiers in a C declarator.
+_PRIMITIVE_TYPE_NAMES = frozenset({"PVOID", "VOID", "BOOL", "INT", "UINT", "DWORD", "LONG", "ULONG"})
+
+# Parser objects are not thread-safe; worker threads each get their own.
+_thread_state = threading.local()
+
 project_path = os.getcwd()
 programming_language = "python"
 prefer_path = ""
 parser: Optional[tree_sitter.Parser] = None
 
-project_data = {
-    "functions": {},
-    "function_calls": {},
-    "function_callees": {},
-    "types": {},
-    "defines": {},
-    "classes": {}
-}
+def _empty_project_data() -> Dict[str, Dict]:
+    return {
+        "functions": {},
+        "function_calls": {},
+        "function_callees": {},
+        "types": {},
+        "defines": {},
+        "classes": {},
+        "sources": {},
+        "function_index": {}
+    }
+
+
+project_data = _empty_project_data()
 
 # Cache configuration
 CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache")
-CACHE_VERSION = "v1"  # Bump this if cache format changes
+CACHE_VERSION = "v2"  # Bump this if cache format changes
 
 
 def _detect_language(file_path: str) -> Optional[str]:
@@ -69,6 +92,33 @@ def _get_parser(lang: Optional[str]) -> Optional[tree_sitter.Parser]:
     return ts_parser
 
 
+def _get_thread_parser(lang: str) -> tree_sitter.Parser:
+    """Per-thread parser for a language already loaded via _get_parser()."""
+    parsers = getattr(_thread_state, "parsers", None)
+    if parsers is None:
+        parsers = _thread_state.parsers = {}
+    ts_parser = parsers.get(lang)
+    if ts_parser is None:
+        ts_parser = tree_sitter.Parser()
+        ts_parser.language = PARSERS[lang].language
+        parsers[lang] = ts_parser
+    return ts_parser
+
+
+def _read_and_parse(file_path: str, lang: str):
+    """Worker: read and parse one file. Returns (content, tree, error)."""
+    try:
+        with open(file_path, "rb") as c_file:
+            file_content = c_file.read()
+    except Exception as e:
+        return None, None, e
+
+    try:
+        return file_content, _get_thread_parser(lang).parse(file_content), None
+    except Exception as exc:
+        return file_content, None, exc
+
+
 def _get_cache_path(proj_path: str) -> str:
     """Get cache file path for a project."""
     path_hash = hashlib.md5(proj_path.encode()).hexdigest()[:12]
@@ -76,22 +126,41 @@ def _get_cache_path(proj_path: str) -> str:
     return os.path.join(CACHE_DIR, f"project_cache_{path_hash}_{CACHE_VERSION}.pkl")
 
 
+def _iter_project_files(proj_path: str) -> Iterator[os.DirEntry]:
+    """
+    Yield indexed source files under proj_path, in the same top-down order as
+    os.walk, using scandir's cached entry types instead of extra stat calls.
+    """
+    stack = [proj_path]
+    while stack:
+        dir_path = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        # Like os.walk, don't descend into symlinked directories
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif os.path.splitext(entry.name)[1] in INDEXED_EXTENSIONS:
+                        yield entry
+        except OSError:
+            continue
+        stack.extend(reversed(subdirs))
+
+
 def _get_project_fingerprint(proj_path: str) -> str:
     """
     Compute a fingerprint of the project based on file paths and modification times.
     This is fast - just stats, no file reads.
     """
     files_info = []
-    for root, dirs, files in os.walk(proj_path):
-        for file in files:
-            if not file.endswith((".c", ".h", ".w", ".cpp", ".hpp", ".py")):
-                continue
-            file_path = os.path.join(root, file)
-            try:
-                stat = os.stat(file_path)
-                files_info.append((file_path, stat.st_mtime, stat.st_size))
-            except OSError:
-                continue
+    for entry in _iter_project_files(proj_path):
+        try:
+            stat = entry.stat()
+            files_info.append((entry.path, stat.st_mtime, stat.st_size))
+        except OSError:
+            continue
     
     files_info.sort()
     fingerprint = hashlib.md5(str(files_info).encode()).hexdigest()
@@ -134,11 +203,12 @@ def _save_cache(cache_path: str, fingerprint: str, data: Dict):
         for file_path, funcs in data["functions"].items():
             serializable_data["functions"][file_path] = {}
             for name, node in funcs.items():
+                start_line, end_line = _get_node_lines(node)
                 serializable_data["functions"][file_path][name] = {
                     "start_byte": node.start_byte,
                     "end_byte": node.end_byte,
-                    "start_line": node.start_point[0] + 1,
-                    "end_line": node.end_point[0] + 1,
+                    "start_line": start_line,
+                    "end_line": end_line,
                 }
         
         with open(cache_path, "wb") as f:
@@ -152,6 +222,8 @@ def _save_cache(cache_path: str, fingerprint: str, data: Dict):
 def init(proj_path, force_reindex: bool = False):
     global parser, project_path, programming_language, project_data
     project_path = proj_path
+    # Cached lookups refer to the previous project_data
+    query_function.cache_clear()
     
     # Check cache first
     cache_path = _get_cache_path(proj_path)
@@ -160,7 +232,10 @@ def init(proj_path, force_reindex: bool = False):
     if not force_reindex:
         cached_data = _load_cache(cache_path, fingerprint)
         if cached_data:
-            project_data = cached_data
+            # The cache leaves out sources / function_index; start them empty
+            # so a later re-index can write into every key
+            project_data = {**_empty_project_data(), **cached_data}
+            _build_function_index()
             print(f"✅ Loaded from cache. Functions in {len(project_data['functions'])} files.", file=sys.stderr)
             return project_data
     
@@ -169,40 +244,48 @@ def init(proj_path, force_reindex: bool = False):
     files_processed = 0
     ts_files = 0
 
-    for root, dirs, files in os.walk(project_path):
-        for file in files:
-            if not (file.endswith((".c", ".h", ".w", ".cpp", ".hpp", ".py"))):
-                continue
-
-            file_path = os.path.join(root, file)
-            lang = _detect_language(file_path)
-            files_processed += 1
-
-            try:
-                with open(file_path, "rb") as c_file:
-                    file_content = c_file.read()
-            except Exception as e:
-                print(f"Warning: Could not read file {file_path}: {e}", file=sys.stderr)
-                continue
-
+    jobs = []
+    langs_by_ext: Dict[str, str] = {}  # resolved (and parser loaded) once per extension
+    for entry in _iter_project_files(project_path):
+        file_path = entry.path
+        files_processed += 1
+
+        ext = os.path.splitext(entry.name)[1]
+        lang = langs_by_ext.get(ext)
+        if lang is None:
+            lang = EXT_TO_LANGUAGE.get(ext.lower())
+            # Load language modules on this thread before any worker needs them
             ts_parser = _get_parser(lang)
             if not ts_parser:
                 raise RuntimeError(f"Tree-sitter parser not available for language '{lang}' (file {file_path}).")
+            parser = parser or ts_parser
+            langs_by_ext[ext] = lang
+        jobs.append((file_path, lang))
+
+    # Reads and parses run in parallel; results are consumed in walk order so
+    # project_data keeps the same file ordering as a serial walk.
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(lambda job: _read_and_parse(*job), jobs)
+        for (file_path, lang), (file_content, tree, error) in zip(jobs, results):
+            if file_content is None:
+                print(f"Warning: Could not read file {file_path}: {error}", file=sys.stderr)
+                continue
 
             try:
-                tree = ts_parser.parse(file_content)
-                parser = parser or ts_parser
+                if error:
+                    raise error
                 programming_language = lang
-                project_data["functions"][file_path], project_data["function_calls"][file_path], project_data["function_callees"][file_path] = parse_all_function_info(file_content, tree)
-                project_data["types"][file_path] = parse_all_type_info(file_content, tree)
-                project_data["defines"][file_path] = parse_all_define_info(file_content, tree)
-                project_data["classes"][file_path] = parse_all_class_info(file_content, tree)
+                project_data["sources"][file_path] = file_content
+                for key, value in walk_once(file_content, tree).items():
+                    project_data[key][file_path] = value
                 ts_files += 1
             except Exception as exc:
                 raise RuntimeError(f"Tree-sitter parse failed for {file_path}: {exc}") from exc
 
     print(f"✅ Initialization complete. Files: {files_processed}, tree-sitter: {ts_files}.", file=sys.stderr)
     
+    _build_function_index()
+
     # Save to cache
     _save_cache(cache_path, fingerprint, project_data)
     
@@ -210,12 +293,21 @@ def init(proj_path, force_reindex: bool = False):
 
 
 def find_nodes_by_type(root_node: tree_sitter.Node, node_type: str) -> List[tree_sitter.Node]:
+    return find_nodes_by_types(root_node, {node_type})
+
+
+def find_nodes_by_types(root_node: tree_sitter.Node, node_types: Set[str]) -> List[tree_sitter.Node]:
+    """Pre-order walk with a tree cursor (no recursion, no per-node child lists)."""
     nodes = []
-    if root_node.type == node_type:
-        nodes.append(root_node)
-    for child_node in root_node.children:
-        nodes.extend(find_nodes_by_type(child_node, node_type))
-    return nodes
+    cursor = root_node.walk()
+    while True:
+        if cursor.node.type in node_types:
+            nodes.append(cursor.node)
+        if cursor.goto_first_child():
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return nodes
 
 
 def find_first_node_by_type(root_node: tree_sitter.Node, node_type: str) -> tree_sitter.Node:
@@ -229,98 +321,172 @@ def find_first_node_by_type(root_node: tree_sitter.Node, node_type: str) -> tree
     return None
 
 
-def parse_all_function_info(source_code, tree: tree_sitter.Tree):
+def _ident(source_code: bytes, node: tree_sitter.Node) -> str:
+    """Decode an identifier's text; identifiers are almost always ASCII, which skips the UTF-8 decoder."""
+    text = source_code[node.start_byte:node.end_byte]
+    try:
+        return text.decode("ascii")
+    except UnicodeDecodeError:
+        return text.decode("utf8", errors="replace")
+
+
+def _c_function_name(source_code, node: tree_sitter.Node) -> Optional[str]:
+    dec_node = find_first_node_by_type(node, "function_declarator")
+    if not dec_node:
+        return None
+
+    call_expr = find_first_node_by_type(dec_node, "call_expression")
+    if call_expr:
+        call_ident = find_first_node_by_type(call_expr, "identifier")
+        if call_ident:
+            potential_name = _ident(source_code, call_ident)
+            if not (potential_name.startswith("_") and _SAL_KEYWORD_RE.search(potential_name)):
+                return potential_name
+
+    for sub_node in dec_node.children:
+        if sub_node.type == "identifier":
+            potential_name = _ident(source_code, sub_node)
+            if not (potential_name.startswith("_") and _SAL_KEYWORD_RE.search(potential_name)):
+                if potential_name not in _PRIMITIVE_TYPE_NAMES:
+                    return potential_name
+    return None
+
+
+def _python_function_name(source_code, node: tree_sitter.Node) -> Optional[str]:
+    name_node = None
+    if hasattr(node, 'child_by_field_name'):
+        try:
+            name_node = node.child_by_field_name('name')
+        except Exception:
+            name_node = None
+
+    if name_node and name_node.type == 'identifier':
+        return _ident(source_code, name_node)
+
+    for child in node.children:
+        if child.type == 'identifier':
+            return _ident(source_code, child)
+
+    ident = find_first_node_by_type(node, 'identifier')
+    if ident:
+        return _ident(source_code, ident)
+    return None
+
+
+def _callee_name(source_code, call_node: tree_sitter.Node) -> Optional[str]:
+    """
+    Name of the function invoked by a C/C++ call_expression or Python call,
+    read from the grammar's "function" field instead of searching the subtree.
+    """
+    callee = call_node.child_by_field_name("function")
+    if callee is not None:
+        # ns::Class::Method / ::GlobalFn: definitions are indexed by their bare
+        # name, so resolve to the innermost "name" of the qualified identifier
+        while callee is not None and callee.type == "qualified_identifier":
+            callee = callee.child_by_field_name("name")
+        if callee is not None and callee.type == "template_function":
+            callee = callee.child_by_field_name("name")
+    if callee is not None:
+        callee_type = callee.type
+        if callee_type == "identifier":
+            return _ident(source_code, callee)
+        if callee_type == "field_expression":
+            # obj->method(...) / obj.method(...)
+            field = callee.child_by_field_name("field")
+            if field is not None:
+                return _ident(source_code, field)
+        elif callee_type == "attribute":
+            # Python obj.method(...)
+            attr = callee.child_by_field_name("attribute")
+            if attr is not None:
+                return _ident(source_code, attr)
+
+    # Anything else (function pointers, casts, subscripts): first identifier in the call
+    call_ident = find_first_node_by_type(call_node, "identifier")
+    if call_ident:
+        return _ident(source_code, call_ident)
+    return None
+
+
+def walk_once(source_code, tree: tree_sitter.Tree) -> Dict[str, Dict]:
+    """
+    Collect all per-file info in a single cursor walk over the tree.
+    A stack of enclosing function definitions attributes each call site to the
+    innermost one as it is visited, instead of re-walking every function body.
+    """
     fun_info = {}
-    fun_call_info = {}
-    fun_callee_info = {}
-    
-    if programming_language in ("c", "cpp"):
-        all_function_nodes = find_nodes_by_type(tree.root_node, "function_definition")
-        for node in all_function_nodes:
-            dec_node = find_first_node_by_type(node, "function_declarator")
-            if not dec_node:
-                continue
-            function_name = None
-            
-            call_expr = find_first_node_by_type(dec_node, "call_expression")
-            if call_expr:
-                call_ident = find_first_node_by_type(call_expr, "identifier")
-                if call_ident:
-                    potential_name = source_code[call_ident.start_byte:call_ident.end_byte].decode("utf8", errors="replace")
-                    if not (potential_name.startswith("_") and any(keyword in potential_name for keyword in ["_Ret_", "_Post_", "_Pre_", "_In_", "_Out_", "_Check_", "_Frees_"])):
-                        function_name = potential_name
-                        fun_info[function_name] = node
-            
-            if not function_name:
-                for sub_node in dec_node.children:
-                    if sub_node.type == "identifier":
-                        potential_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8", errors="replace")
-                        if not (potential_name.startswith("_") and any(keyword in potential_name for keyword in ["_Ret_", "_Post_", "_Pre_", "_In_", "_Out_", "_Check_", "_Frees_"])):
-                            if potential_name not in ["PVOID", "VOID", "BOOL", "INT", "UINT", "DWORD", "LONG", "ULONG"]:
-                                function_name = potential_name
-                                fun_info[function_name] = node
-                                break
-            if function_name:
-                call_nodes = find_nodes_by_type(node, "call_expression")
-                for call_node in call_nodes:
-                    call_ident = find_first_node_by_type(call_node, "identifier")
-                    if call_ident:
-                        called_name = source_code[call_ident.start_byte:call_ident.end_byte].decode("utf8", errors="replace")
-                        if called_name not in fun_call_info:
-                            fun_call_info[called_name] = set()
-                        fun_call_info[called_name].add(function_name)
-                        if function_name not in fun_callee_info:
-                            fun_callee_info[function_name] = set()
-                        fun_callee_info[function_name].add(called_name)
-        
-        all_def_funciton_nodes = find_nodes_by_type(tree.root_node, "preproc_function_def")
-        for node in all_def_funciton_nodes:
-            for sub_node in node.children:
-                if sub_node.type == "identifier":
-                    function_name = source_code[sub_node.start_byte:sub_node.end_byte].decode("utf8", errors="replace")
-                    fun_info[function_name] = node
+    # Edges are appended per call site and deduplicated once after the walk
+    fun_call_info = defaultdict(list)
+    fun_callee_info = defaultdict(list)
+    macro_nodes = []
+    file_info = {
+        "functions": fun_info,
+        "function_calls": {},
+        "function_callees": {},
+        "types": {},
+        "defines": {},
+        "classes": {},
+    }
 
+    is_c = programming_language in ("c", "cpp")
+    if is_c:
+        call_type, get_function_name = "call_expression", _c_function_name
     elif programming_language == "python":
-        all_function_nodes = find_nodes_by_type(tree.root_node, "function_definition")
-        for node in all_function_nodes:
-            function_name = None
-            name_node = None
-            if hasattr(node, 'child_by_field_name'):
-                try:
-                    name_node = node.child_by_field_name('name')
-                except Exception:
-                    name_node = None
-
-            if name_node and name_node.type == 'identifier':
-                function_name = source_code[name_node.start_byte:name_node.end_byte].decode('utf8', errors="replace")
+        call_type, get_function_name = "call", _python_function_name
+    else:
+        return file_info
+
+    # (depth, function_name) for every named function_definition above the cursor
+    enclosing = []
+    cursor = tree.root_node.walk()
+    depth = 0
+    while True:
+        node = cursor.node
+        node_type = node.type
+        if node_type == "function_definition":
+            function_name = get_function_name(source_code, node)
+            if function_name:
+                fun_info[function_name] = node
+                enclosing.append((depth, function_name))
+        elif node_type == call_type and enclosing:
+            called_name = _callee_name(source_code, node)
+            if called_name:
+                function_name = enclosing[-1][1]
+                fun_call_info[called_name].append(function_name)
+                fun_callee_info[function_name].append(called_name)
+        elif is_c and node_type == "preproc_function_def":
+            macro_nodes.append(node)
+
+        if cursor.goto_first_child():
+            depth += 1
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                break
+            depth -= 1
+        else:
+            # Moved to a sibling: every function at this depth or deeper is finished
+            while enclosing and enclosing[-1][0] >= depth:
+                enclosing.pop()
+            continue
+        break
+
+    # Macro definitions take precedence over function definitions of the same name
+    for node in macro_nodes:
+        for sub_node in node.children:
+            if sub_node.type == "identifier":
+                function_name = _ident(source_code, sub_node)
                 fun_info[function_name] = node
-            else:
-                for child in node.children:
-                    if child.type == 'identifier':
-                        function_name = source_code[child.start_byte:child.end_byte].decode('utf8', errors="replace")
-                        fun_info[function_name] = node
-                        break
-
-                if not function_name:
-                    ident = find_first_node_by_type(node, 'identifier')
-                    if ident:
-                        function_name = source_code[ident.start_byte:ident.end_byte].decode('utf8', errors="replace")
-                        fun_info[function_name] = node
 
-            if function_name:
-                call_nodes = find_nodes_by_type(node, "call")
-                for call_node in call_nodes:
-                    call_ident = find_first_node_by_type(call_node, "identifier")
-                    if call_ident:
-                        called_name = source_code[call_ident.start_byte:call_ident.end_byte].decode("utf8", errors="replace")
-                        if called_name not in fun_call_info:
-                            fun_call_info[called_name] = set()
-                        fun_call_info[called_name].add(function_name)
-                        if function_name not in fun_callee_info:
-                            fun_callee_info[function_name] = set()
-                        fun_callee_info[function_name].add(called_name)
+    # Deduplicate, keeping first-seen order
+    file_info["function_calls"] = {k: list(dict.fromkeys(v)) for k, v in fun_call_info.items()}
+    file_info["function_callees"] = {k: list(dict.fromkeys(v)) for k, v in fun_callee_info.items()}
+    return file_info
 
-    return fun_info, fun_call_info, fun_callee_info
+
+def parse_all_function_info(source_code, tree: tree_sitter.Tree):
+    file_info = walk_once(source_code, tree)
+    return file_info["functions"], file_info["function_calls"], file_info["function_callees"]
 
 
 def parse_all_type_info(source_code, tree: tree_sitter.Tree):
@@ -335,6 +501,16 @@ def parse_all_class_info(source_code, tree: tree_sitter.Tree):
     return {}
 
 
+def _get_node_lines(node: tree_sitter.Node) -> Tuple[int, int]:
+    """1-based, inclusive (start_line, end_line) of a tree-sitter node."""
+    start_line = node.start_point[0] + 1  # tree-sitter uses 0-based indexing
+    end_line = node.end_point[0] + 1
+    # Macro definitions include their trailing newline, ending at column 0 of the next line
+    if node.end_point[1] == 0 and end_line > start_line:
+        end_line -= 1
+    return start_line, end_line
+
+
 def _get_node_bytes(node_or_dict) -> Tuple[int, int]:
     """Get start_byte and end_byte from either a tree-sitter node or cached dict."""
     if hasattr(node_or_dict, 'start_byte'):
@@ -345,6 +521,35 @@ def _get_node_bytes(node_or_dict) -> Tuple[int, int]:
         return node_or_dict["start_byte"], node_or_dict["end_byte"]
 
 
+def _build_function_index():
+    """Map function name -> [(file_path, node), ...] in file walk order."""
+    index = {}
+    for path, funcs in project_data["functions"].items():
+        for name, node in funcs.items():
+            index.setdefault(name, []).append((path, node))
+    project_data["function_index"] = index
+
+
+def _lookup_function(function_name: str):
+    """First (file_path, node) defining function_name, or None."""
+    if "function_index" not in project_data:
+        _build_function_index()
+    entries = project_data["function_index"].get(function_name)
+    return entries[0] if entries else None
+
+
+def _get_source(file_path: str) -> bytes:
+    """Source bytes of a file, from init's in-memory copy or read once on demand."""
+    sources = project_data.setdefault("sources", {})
+    source_code = sources.get(file_path)
+    if source_code is None:
+        with open(file_path, "rb") as f:
+            source_code = f.read()
+        sources[file_path] = source_code
+    return source_code
+
+
+@functools.lru_cache(maxsize=4096)
 def query_function(function_name: str, file_path: str = None) -> str:
     file_to_fundef = project_data["functions"]
 
@@ -352,80 +557,110 @@ def query_function(function_name: str, file_path: str = None) -> str:
         if file_path in file_to_fundef and function_name in file_to_fundef[file_path]:
             node = file_to_fundef[file_path][function_name]
             start_byte, end_byte = _get_node_bytes(node)
-            with open(file_path, "rb") as f:
-                source_code = f.read()
+            source_code = _get_source(file_path)
             return source_code[start_byte:end_byte].decode("utf8", errors="replace")
         return ""
 
-    for path, fun_info in file_to_fundef.items():
-        if function_name in fun_info:
-            node = fun_info[function_name]
-            start_byte, end_byte = _get_node_bytes(node)
-            with open(path, "rb") as f:
-                source_code = f.read()
-            return source_code[start_byte:end_byte].decode("utf8", errors="replace")
+    entry = _lookup_function(function_name)
+    if entry:
+        path, node = entry
+        start_byte, end_byte = _get_node_bytes(node)
+        source_code = _get_source(path)
+        return source_code[start_byte:end_byte].decode("utf8", errors="replace")
     return ""
 
 
-def build_call_graph(function_name, visited=None, file_path=None):
-    if not project_data:
-        raise ValueError("Project data is not initialized. Please run init() first.")
-
-    if visited is None:
-        visited = set()
-
-    if function_name in visited:
-        return {"function": function_name, "calls": "Already visited (cycle)"}
-
-    visited.add(function_name)
-
+def _call_graph_node(name, path_hint=None):
+    """Node dict for one function plus its callee names (empty if not found)"""
     target_path = None
-    if file_path:
-        funcs = project_data["functions"].get(file_path, {})
-        if function_name in funcs:
-            target_path = file_path
+    func_node = None
+    if path_hint:
+        func_node = project_data["functions"].get(path_hint, {}).get(name)
+        if func_node is not None:
+            target_path = path_hint
 
     if not target_path:
-        for path, functions in project_data["functions"].items():
-            if function_name in functions:
-                target_path = path
-                break
+        entry = _lookup_function(name)
+        if entry:
+            target_path, func_node = entry
 
     if not target_path:
-        print(f"⚠️ Function {function_name} not found in project.")
+        print(f"⚠️ Function {name} not found in project.")
         return {
             "file": "unknown",
-            "function": function_name,
+            "function": name,
             "calls": []
-        }
-
-    print(f"Analyzing function: {function_name} in {target_path}")
+        }, []
 
-    callees = project_data["function_callees"].get(target_path, {}).get(function_name, set())
-
-    calls = []
-    for callee in callees:
-        callee_subgraph = build_call_graph(callee, visited, None)
-        calls.append(callee_subgraph)
+    print(f"Analyzing function: {name} in {target_path}")
 
     # Get line numbers from the function node
     start_line = 0
     end_line = 0
-    func_node = project_data["functions"].get(target_path, {}).get(function_name)
-    if func_node:
-        if hasattr(func_node, 'start_point'):
-            # tree-sitter node
-            start_line = func_node.start_point[0] + 1  # tree-sitter uses 0-based indexing
-            end_line = func_node.end_point[0] + 1
-        else:
-            # cached dict
-            start_line = func_node.get("start_line", 0)
-            end_line = func_node.get("end_line", 0)
+    if hasattr(func_node, 'start_point'):
+        # tree-sitter node
+        start_line, end_line = _get_node_lines(func_node)
+    else:
+        # cached dict
+        start_line = func_node.get("start_line", 0)
+        end_line = func_node.get("end_line", 0)
 
-    return {
+    node_dict = {
         "file": target_path,
-        "function": function_name,
+        "function": name,
         "start_line": start_line,
         "end_line": end_line,
-        "calls": calls
+        "calls": []
     }
+    callees = project_data["function_callees"].get(target_path, {}).get(name, [])
+    return node_dict, callees
+
+
+def build_call_graph(function_name, visited=None, file_path=None):
+    """
+    Build the call graph rooted at function_name with an iterative DFS.
+    Each function is expanded once and later references from other callers
+    reuse the same node dict. A call back to a function on the current path
+    (recursion) becomes an "Already visited (cycle)" stub, so the result is
+    acyclic and JSON-serializable. Names already in visited are stubbed too.
+    """
+    if not project_data:
+        raise ValueError("Project data is not initialized. Please run init() first.")
+
+    if visited is None:
+        visited = set()
+
+    if function_name in visited:
+        return {"function": function_name, "calls": "Already visited (cycle)"}
+
+    visited.add(function_name)
+    root, callees = _call_graph_node(function_name, file_path)
+    memo = {function_name: root}
+    on_path = {function_name}
+    # (node dict being expanded, iterator over its remaining callee names)
+    stack = [(root, iter(callees))]
+    while stack:
+        node_dict, remaining = stack[-1]
+        name = next(remaining, None)
+        if name is None:
+            stack.pop()
+            on_path.discard(node_dict["function"])
+            continue
+
+        if name in on_path or (name in visited and name not in memo):
+            node_dict["calls"].append({"function": name, "calls": "Already visited (cycle)"})
+            continue
+
+        if name in memo:
+            node_dict["calls"].append(memo[name])
+            continue
+
+        visited.add(name)
+        child, child_callees = _call_graph_node(name)
+        memo[name] = child
+        node_dict["calls"].append(child)
+        if child_callees:
+            on_path.add(name)
+            stack.append((child, iter(child_callees)))
+
+    return root
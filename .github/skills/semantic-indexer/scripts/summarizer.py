@@ -4,82 +4,161 @@ Bottom-up summarization workflow
 """
 
 import argparse
+import contextlib
 import json
 import sys
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List
 
 # Add scripts directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 import query_repo
-from indexer import SemanticIndex
+from indexer import SemanticIndex, SQL_PRECONDITIONS, SQL_POSTCONDITIONS, SQL_FUNCTION_ID_BY_NAME
 
+# Project passed via --project; query_repo is only initialized (a full
+# project parse) if a function's source can't be read from its line range.
+_query_repo_project: Optional[str] = None
+_query_repo_ready = False
 
-def find_next_summary_target(index: SemanticIndex, entry_id: int, visited: set) -> Tuple[Optional[Dict], bool]:
+# file -> source lines, read once per process
+_source_lines_cache: Dict[str, List[str]] = {}
+
+
+def _read_source_lines(file_path: str) -> Optional[List[str]]:
+    lines = _source_lines_cache.get(file_path)
+    if lines is None:
+        try:
+            with open(file_path, "rb") as f:
+                lines = f.read().decode("utf8", errors="replace").split("\n")
+        except OSError:
+            return None
+        _source_lines_cache[file_path] = lines
+    return lines
+
+
+def get_source_code(func: Dict) -> str:
     """
-    Post-order traversal to find next node to summarize.
-    
-    Returns (target_node, is_subtree_summarized)
-    - target_node: First unsummarized node whose callees are all summarized
-    - is_subtree_summarized: True if this subtree is fully summarized
+    Source of a DB function, sliced from its file by start_line/end_line.
+    Falls back to query_repo when the file or line range is unknown.
     """
-    if entry_id in visited:
-        # Already visited - check if it's summarized
-        func = index.get_function_info(entry_id)
-        if func and func["summary"].strip():
-            return None, True
-        return None, False
+    global _query_repo_ready
     
-    visited.add(entry_id)
+    if func["file"] != "unknown" and func["start_line"] and func["end_line"]:
+        lines = _read_source_lines(func["file"])
+        if lines:
+            source_code = "\n".join(lines[func["start_line"] - 1:func["end_line"]])
+            if source_code.strip():
+                return source_code
     
-    # Get function info
-    func = index.get_function_info(entry_id)
-    if not func:
-        return None, True  # Unknown function treated as summarized
-    
-    # Get callees
-    callees = index.get_callees(entry_id)
-    
-    # Check if this node is already summarized
-    is_summarized = bool(func["summary"].strip())
-    
-    if is_summarized:
-        # Already summarized - check callees to continue traversal
-        all_callees_done = True
-        for callee in callees:
-            target, subtree_done = find_next_summary_target(index, callee["function_id"], visited)
-            if target:
-                return target, False
-            if not subtree_done:
-                all_callees_done = False
-        return None, all_callees_done
-    
-    # Not summarized yet - check if all callees are done (post-order)
-    all_callees_summarized = True
-    for callee in callees:
-        target, subtree_done = find_next_summary_target(index, callee["function_id"], visited)
-        if target:
-            # Found a target in subtree - return it
-            return target, False
-        if not subtree_done:
-            all_callees_summarized = False
-    
-    # If all callees are summarized (or no callees), this is our target
-    if all_callees_summarized:
-        return func, False
-    
-    # Some callees not summarized yet
-    return None, False
-
-
-def build_callee_tree(index: SemanticIndex, callee: Dict, depth: int, max_depth: int, visited: set = None) -> Dict:
+    if _query_repo_project and not _query_repo_ready:
+        query_repo.init(_query_repo_project)
+        _query_repo_ready = True
+    
+    return query_repo.query_function(
+        func["name"],
+        func["file"] if func["file"] != "unknown" else None
+    )
+
+
+SQL_READY_FUNCTIONS = """
+    SELECT function_id, name, file, start_line, end_line
+    FROM functions
+    WHERE summary = '' AND unsummarized_callee_count = 0
+    ORDER BY function_id
+    LIMIT ?
+"""
+
+
+# Nothing is ready but work remains: the rest are blocked by call cycles.
+# Break one open at the member waiting on the fewest unsummarized callees.
+SQL_CYCLE_BREAK_FUNCTIONS = """
+    SELECT function_id, name, file, start_line, end_line
+    FROM functions
+    WHERE summary = ''
+    ORDER BY unsummarized_callee_count, function_id
+    LIMIT ?
+"""
+
+CYCLE_BREAK_NOTE = (
+    "This function is part of a call cycle, so some of its callees are not summarized yet. "
+    "Summarize it from its source code and the callee summaries that are available."
+)
+
+
+def _get_ready_functions(index: SemanticIndex, limit: int, break_cycles: bool = False) -> List[Dict]:
+    """
+    Unsummarized functions whose callees are all summarized, read from the
+    maintained unsummarized_callee_count. A function's call to itself doesn't block it.
+    With break_cycles, fall back to the unsummarized functions with the fewest
+    unsummarized callees (use only once nothing is ready).
+    """
+    sql = SQL_CYCLE_BREAK_FUNCTIONS if break_cycles else SQL_READY_FUNCTIONS
+    cursor = index.conn.execute(sql, (limit,))
+    return [
+        {
+            "function_id": row[0],
+            "name": row[1],
+            "file": row[2],
+            "start_line": row[3],
+            "end_line": row[4]
+        }
+        for row in cursor
+    ]
+
+
+def _count_unsummarized(index: SemanticIndex) -> int:
+    """Counted from the idx_ready_functions partial index, not a table scan."""
+    return index.conn.execute("SELECT COUNT(*) FROM functions WHERE summary = ''").fetchone()[0]
+
+
+def _get_callees_cached(index: SemanticIndex, func_id: int, callee_cache: Dict[int, List[Dict]]) -> List[Dict]:
+    """get_callees, memoized in callee_cache for the duration of one command."""
+    callees = callee_cache.get(func_id)
+    if callees is None:
+        callees = callee_cache[func_id] = index.get_callees(func_id)
+    return callees
+
+
+def _prefetch_callee_trees(
+    index: SemanticIndex,
+    callees: List[Dict],
+    max_depth: int,
+    callee_cache: Dict[int, List[Dict]]
+):
+    """
+    Fill callee_cache for every node build_callee_tree may expand,
+    with one batched query per tree level instead of one per node.
+    """
+    frontier = [c["function_id"] for c in callees if c.get("function_id")]
+    for _ in range(1, max_depth):
+        frontier = list(dict.fromkeys(frontier))
+        missing = [func_id for func_id in frontier if func_id not in callee_cache]
+        if missing:
+            callee_cache.update(index.get_callees_bulk(missing))
+        # build_callee_tree only descends into the first 5 callees of a node
+        frontier = [sc["function_id"] for func_id in frontier for sc in callee_cache[func_id][:5]]
+        if not frontier:
+            break
+
+
+def build_callee_tree(
+    index: SemanticIndex,
+    callee: Dict,
+    depth: int,
+    max_depth: int,
+    visited: set = None,
+    callee_cache: Dict[int, List[Dict]] = None
+) -> Dict:
     """
     Build nested callee tree up to max_depth.
     Returns callee info with nested 'calls' array.
+    Pass the same callee_cache across calls to share callee lookups.
     """
     if visited is None:
         visited = set()
+    if callee_cache is None:
+        callee_cache = {}
     
     func_id = callee.get("function_id")
     if func_id in visited:
@@ -103,11 +182,11 @@ def build_callee_tree(index: SemanticIndex, callee: Dict, depth: int, max_depth:
         return result
     
     # Get sub-callees
-    sub_callees = index.get_callees(func_id) if func_id else []
+    sub_callees = _get_callees_cached(index, func_id, callee_cache) if func_id else []
     if sub_callees:
         # Limit to first 5 callees per level to avoid explosion
         result["calls"] = [
-            build_callee_tree(index, sc, depth + 1, max_depth, visited.copy())
+            build_callee_tree(index, sc, depth + 1, max_depth, visited.copy(), callee_cache)
             for sc in sub_callees[:5]
         ]
     
@@ -116,90 +195,91 @@ def build_callee_tree(index: SemanticIndex, callee: Dict, depth: int, max_depth:
 
 def get_next_target(index: SemanticIndex) -> Dict[str, Any]:
     """
-    Find next function to summarize (bottom-up)
+    Find next function to summarize (bottom-up): one whose callees are all summarized
     RETURNS ACTUAL SOURCE CODE for the agent to read!
     """
     
-    # Get all functions (roots of any focal trees)
-    cursor = index.conn.execute("SELECT DISTINCT function_id FROM functions")
-    all_funcs = [row[0] for row in cursor]
-    
-    if not all_funcs:
-        return {
-            "status": "error",
-            "message": "No functions in database"
-        }
-    
-    # Try each function as a potential root
-    visited = set()
-    for func_id in all_funcs:
-        target, complete = find_next_summary_target(index, func_id, visited)
-        if target:
-            # Get callee summaries
-            callees = index.get_callees(target["function_id"])
-            
-            # Get source code using query_repo
-            source_code = query_repo.query_function(
-                target["name"], 
-                target["file"] if target["file"] != "unknown" else None
-            )
-            
-            if not source_code:
-                source_code = "Function code not found."
-            
-            # Get pre/postconditions
-            cursor = index.conn.execute(
-                """SELECT condition_text FROM preconditions 
-                   WHERE function_id = ? ORDER BY sequence_order""",
-                (target["function_id"],)
-            )
-            preconditions = [row[0] for row in cursor]
-            
-            cursor = index.conn.execute(
-                """SELECT condition_text FROM postconditions 
-                   WHERE function_id = ? ORDER BY sequence_order""",
-                (target["function_id"],)
-            )
-            postconditions = [row[0] for row in cursor]
-            
-            # Get callee summaries with their callees (nested up to depth 5 for context)
-            callees_with_context = []
-            for c in callees:
-                callee_info = build_callee_tree(index, c, depth=1, max_depth=5)
-                callees_with_context.append(callee_info)
-            
+    ready = _get_ready_functions(index, 1)
+    cycle_break = False
+    if not ready:
+        total, unsummarized = index.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(summary = ''), 0) FROM functions"
+        ).fetchone()
+        if not total:
             return {
-                "status": "needs_summary",
-                "function_id": target["function_id"],
-                "function": target["name"],
-                "file": target["file"],
-                "start_line": target["start_line"],
-                "end_line": target["end_line"],
-                "source_code": source_code,  # ← ACTUAL SOURCE CODE!
-                "preconditions": preconditions,
-                "postconditions": postconditions,
-                "callees": callees_with_context,
-                "summary_instructions": "Write a concise paragraph summary covering the function's purpose, how outputs depend on inputs, any global or shared state it reads or mutates, and which callees have side effects, can fail, or contain complex branching that a test might need to exercise."
+                "status": "error",
+                "message": "No functions in database"
             }
+        if not unsummarized:
+            # All functions summarized
+            return {
+                "status": "complete",
+                "message": "All functions in database are summarized"
+            }
+        ready = _get_ready_functions(index, 1, break_cycles=True)
+        cycle_break = True
     
-    # All functions summarized
-    return {
-        "status": "complete",
-        "message": "All functions in database are summarized"
+    target = ready[0]
+    
+    # Get callee summaries
+    callees = index.get_callees(target["function_id"])
+    
+    # Get source code
+    source_code = get_source_code(target)
+    
+    if not source_code:
+        source_code = "Function code not found."
+    
+    # Get pre/postconditions
+    cursor = index.conn.execute(SQL_PRECONDITIONS, (target["function_id"],))
+    preconditions = [row[0] for row in cursor]
+    
+    cursor = index.conn.execute(SQL_POSTCONDITIONS, (target["function_id"],))
+    postconditions = [row[0] for row in cursor]
+    
+    # Get callee summaries with their callees (nested up to depth 5 for context)
+    callee_cache = {target["function_id"]: callees}
+    _prefetch_callee_trees(index, callees, 5, callee_cache)
+    callees_with_context = []
+    for c in callees:
+        callee_info = build_callee_tree(index, c, depth=1, max_depth=5, callee_cache=callee_cache)
+        callees_with_context.append(callee_info)
+    
+    result = {
+        "status": "needs_summary",
+        "function_id": target["function_id"],
+        "function": target["name"],
+        "file": target["file"],
+        "start_line": target["start_line"],
+        "end_line": target["end_line"],
+        "source_code": source_code,  # ← ACTUAL SOURCE CODE!
+        "preconditions": preconditions,
+        "postconditions": postconditions,
+        "callees": callees_with_context,
+        "summary_instructions": "Write a concise paragraph summary covering the function's purpose, how outputs depend on inputs, any global or shared state it reads or mutates, and which callees have side effects, can fail, or contain complex branching that a test might need to exercise."
     }
+    if cycle_break:
+        result["cycle_break"] = True
+        result["note"] = CYCLE_BREAK_NOTE
+    return result
 
 
 def update_summary(index: SemanticIndex, function_name: str, summary: str, function_id: int = None) -> Dict:
     """Update function summary. If function_id provided, use it directly."""
     
+    # serve/run_command pass JSON values through unchecked; a NULL summary
+    # would be neither summarized nor pending and never unblock its callers
+    if not isinstance(summary, str):
+        return {
+            "status": "error",
+            "message": "Summary must be a string"
+        }
+    
     if function_id:
         func_id = function_id
     else:
         # Find function by name
-        cursor = index.conn.execute(
-            "SELECT function_id FROM functions WHERE name = ? LIMIT 1",
-            (function_name,)
-        )
+        cursor = index.conn.execute(SQL_FUNCTION_ID_BY_NAME, (function_name,))
         row = cursor.fetchone()
         func_id = row[0] if row else None
     
@@ -219,23 +299,36 @@ def update_summary(index: SemanticIndex, function_name: str, summary: str, funct
     }
 
 
-def add_annotation(
+ANNOTATION_TABLES = {"precondition": "preconditions", "postcondition": "postconditions"}
+
+
+def add_annotations_bulk(
     index: SemanticIndex,
     function_name: str,
     ann_type: str,
-    text: str,
+    texts: List[str],
     function_id: int = None
 ) -> Dict:
-    """Add precondition or postcondition. If function_id provided, use it directly."""
+    """Add several preconditions or postconditions in one transaction. If function_id provided, use it directly."""
+    
+    table = ANNOTATION_TABLES.get(ann_type)
+    if not table:
+        return {
+            "status": "error",
+            "message": f"Unknown annotation type: {ann_type} (expected one of {', '.join(ANNOTATION_TABLES)})"
+        }
+    
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return {
+            "status": "error",
+            "message": "Annotation texts must be a JSON list of strings"
+        }
     
     if function_id:
         func_id = function_id
     else:
         # Find function by name
-        cursor = index.conn.execute(
-            "SELECT function_id FROM functions WHERE name = ? LIMIT 1",
-            (function_name,)
-        )
+        cursor = index.conn.execute(SQL_FUNCTION_ID_BY_NAME, (function_name,))
         row = cursor.fetchone()
         func_id = row[0] if row else None
     
@@ -245,21 +338,39 @@ def add_annotation(
             "message": f"Function not found: {function_name}"
         }
     
-    table = "preconditions" if ann_type == "precondition" else "postconditions"
-    
-    # Get next sequence number
-    cursor = index.conn.execute(
-        f"SELECT COALESCE(MAX(sequence_order), -1) + 1 FROM {table} WHERE function_id = ?",
-        (func_id,)
-    )
-    seq = cursor.fetchone()[0]
+    with index.conn:
+        # Get next sequence number
+        cursor = index.conn.execute(
+            f"SELECT COALESCE(MAX(sequence_order), -1) + 1 FROM {table} WHERE function_id = ?",
+            (func_id,)
+        )
+        seq = cursor.fetchone()[0]
+        
+        # Insert
+        index.conn.executemany(
+            f"INSERT INTO {table} (function_id, condition_text, sequence_order) VALUES (?, ?, ?)",
+            [(func_id, text, seq + i) for i, text in enumerate(texts)]
+        )
     
-    # Insert
-    index.conn.execute(
-        f"INSERT INTO {table} (function_id, condition_text, sequence_order) VALUES (?, ?, ?)",
-        (func_id, text, seq)
-    )
-    index.conn.commit()
+    return {
+        "status": "ok",
+        "function": function_name,
+        "type": ann_type,
+        "texts": texts
+    }
+
+
+def add_annotation(
+    index: SemanticIndex,
+    function_name: str,
+    ann_type: str,
+    text: str,
+    function_id: int = None
+) -> Dict:
+    """Add precondition or postcondition. If function_id provided, use it directly."""
+    result = add_annotations_bulk(index, function_name, ann_type, [text], function_id)
+    if result["status"] != "ok":
+        return result
     
     return {
         "status": "ok",
@@ -294,54 +405,29 @@ def get_ready_batch(index: SemanticIndex, max_batch: int = 50) -> Dict[str, Any]
     Returns a batch that can be processed in parallel.
     """
     
-    # Get all unsummarized functions
-    cursor = index.conn.execute("""
-        SELECT function_id, name, file, start_line, end_line 
-        FROM functions 
-        WHERE summary IS NULL OR summary = ''
-    """)
-    unsummarized = {row[0]: {
-        "function_id": row[0],
-        "name": row[1],
-        "file": row[2],
-        "start_line": row[3],
-        "end_line": row[4]
-    } for row in cursor}
-    
-    if not unsummarized:
+    remaining = _count_unsummarized(index)
+    if not remaining:
         return {"status": "complete", "message": "All functions summarized", "batch": []}
     
-    # For each unsummarized function, check if all callees are summarized
-    ready = []
-    for func_id, func_info in unsummarized.items():
-        callees = index.get_callees(func_id)
-        
-        # Check if all callees are summarized (or not in our DB)
-        all_callees_ready = True
-        for callee in callees:
-            callee_id = callee.get("function_id")
-            if callee_id in unsummarized:
-                # Callee exists but not summarized yet
-                all_callees_ready = False
-                break
-        
-        if all_callees_ready:
-            ready.append(func_info)
-            if len(ready) >= max_batch:
-                break
+    ready = _get_ready_functions(index, max_batch)
     
     if not ready:
-        # This shouldn't happen in a DAG, but handle circular deps
+        # Only call cycles remain: hand out one member; summarizing it
+        # usually makes the rest of its cycle ready
+        ready = _get_ready_functions(index, 1, break_cycles=True)
         return {
-            "status": "error", 
-            "message": "No functions ready - possible circular dependencies",
-            "batch": []
+            "status": "ok",
+            "batch_size": len(ready),
+            "total_remaining": remaining,
+            "batch": ready,
+            "cycle_break": True,
+            "note": CYCLE_BREAK_NOTE
         }
     
     return {
         "status": "ok",
         "batch_size": len(ready),
-        "total_remaining": len(unsummarized),
+        "total_remaining": remaining,
         "batch": ready
     }
 
@@ -355,17 +441,16 @@ def get_function_context(index: SemanticIndex, func_id: int) -> Dict[str, Any]:
     callees = index.get_callees(func_id)
     
     # Get source code
-    source_code = query_repo.query_function(
-        func["name"],
-        func["file"] if func["file"] != "unknown" else None
-    )
+    source_code = get_source_code(func)
     if not source_code:
         source_code = "Function code not found."
     
     # Get callee context
+    callee_cache = {func_id: callees}
+    _prefetch_callee_trees(index, callees, 3, callee_cache)
     callees_with_context = []
     for c in callees:
-        callee_info = build_callee_tree(index, c, depth=1, max_depth=3)
+        callee_info = build_callee_tree(index, c, depth=1, max_depth=3, callee_cache=callee_cache)
         callees_with_context.append(callee_info)
     
     return {
@@ -380,6 +465,55 @@ def get_function_context(index: SemanticIndex, func_id: int) -> Dict[str, Any]:
     }
 
 
+COMMANDS = {
+    "next": lambda index, kw: get_next_target(index),
+    "next-batch": lambda index, kw: get_ready_batch(index, kw.get("max", 50)),
+    "context": lambda index, kw: get_function_context(index, kw["function_id"]),
+    "update": lambda index, kw: update_summary(index, kw["function"], kw["summary"], kw.get("function_id")),
+    "annotate": lambda index, kw: add_annotation(index, kw["function"], kw["type"], kw["text"], kw.get("function_id")),
+    "annotate-batch": lambda index, kw: add_annotations_bulk(index, kw["function"], kw["type"], kw["texts"], kw.get("function_id")),
+    "status": lambda index, kw: get_status(index),
+}
+
+
+def run_command(index: SemanticIndex, command: str, **kwargs) -> Dict[str, Any]:
+    """
+    Run a CLI command in-process and return its result dict.
+    Lets batch drivers import this module instead of forking a subprocess per call.
+    """
+    handler = COMMANDS.get(command)
+    if not handler:
+        return {"status": "error", "message": f"Unknown command: {command}"}
+    return handler(index, kwargs)
+
+
+def serve(index: SemanticIndex, infile=sys.stdin, outfile=sys.stdout) -> None:
+    """
+    Answer commands from a long-lived process until EOF on infile.
+    
+    Each input line is a JSON object {"cmd": ..., "args": {...}} where args
+    uses the same keys as run_command (e.g. "function_id", "summary").
+    Each response is written as one line of JSON. The DB connection and
+    source-line cache stay warm across commands.
+    """
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+            result = run_command(index, request["cmd"], **request.get("args", {}))
+        except (ValueError, KeyError, TypeError) as e:
+            result = {"status": "error", "message": f"Bad request: {e}"}
+        except Exception as e:
+            # e.g. sqlite3.IntegrityError for an unknown function_id; keep serving
+            if index.conn.in_transaction:
+                index.conn.rollback()
+            result = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+        outfile.write(json.dumps(result) + "\n")
+        outfile.flush()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Bottom-up summarization with SOURCE CODE context"
@@ -412,49 +546,46 @@ def main():
     ann_parser = subparsers.add_parser("annotate", help="Add annotation")
     ann_parser.add_argument("--function", required=True, help="Function name")
     ann_parser.add_argument("--function-id", type=int, help="Function ID (optional, more precise than name)")
-    ann_parser.add_argument("--type", required=True, choices=["precondition", "postcondition"])
+    ann_parser.add_argument("--type", required=True, choices=list(ANNOTATION_TABLES))
     ann_parser.add_argument("--text", required=True, help="Condition text")
     
+    # annotate-batch
+    ann_batch_parser = subparsers.add_parser("annotate-batch", help="Add several annotations (JSON list of texts on stdin)")
+    ann_batch_parser.add_argument("--function", required=True, help="Function name")
+    ann_batch_parser.add_argument("--function-id", type=int, help="Function ID (optional, more precise than name)")
+    ann_batch_parser.add_argument("--type", required=True, choices=list(ANNOTATION_TABLES))
+    
     # status
     subparsers.add_parser("status", help="Show summarization progress")
     
+    # serve
+    subparsers.add_parser("serve", help="Read JSON commands from stdin, one per line, until EOF")
+    
     args = parser.parse_args()
     
     if not args.command:
         parser.print_help()
         return
     
-    # Initialize query_repo if needed (for source code retrieval)
-    if args.command in ("next", "next-batch", "context") and args.project:
-        query_repo.init(args.project)
-    
-    index = SemanticIndex(args.db)
-    
-    if args.command == "next":
-        result = get_next_target(index)
-        print(json.dumps(result, indent=2))
-    
-    elif args.command == "next-batch":
-        result = get_ready_batch(index, args.max)
-        print(json.dumps(result, indent=2))
+    # query_repo is initialized lazily, only if source can't be read by line range
+    global _query_repo_project
+    _query_repo_project = args.project
     
-    elif args.command == "context":
-        result = get_function_context(index, args.function_id)
-        print(json.dumps(result, indent=2))
-    
-    elif args.command == "update":
-        func_id = getattr(args, 'function_id', None)
-        result = update_summary(index, args.function, args.summary, func_id)
-        print(json.dumps(result, indent=2))
-    
-    elif args.command == "annotate":
-        func_id = getattr(args, 'function_id', None)
-        result = add_annotation(index, args.function, args.type, args.text, func_id)
-        print(json.dumps(result, indent=2))
-    
-    elif args.command == "status":
-        result = get_status(index)
-        print(json.dumps(result, indent=2))
+    with contextlib.closing(SemanticIndex(args.db)) as index:
+        if args.command == "serve":
+            serve(index)
+            return
+        
+        kwargs = {k: v for k, v in vars(args).items() if k not in ("db", "project", "command")}
+        result = None
+        if args.command == "annotate-batch":
+            try:
+                kwargs["texts"] = json.load(sys.stdin)
+            except ValueError as e:
+                result = {"status": "error", "message": f"Invalid JSON on stdin: {e}"}
+        if result is None:
+            result = run_command(index, args.command, **kwargs)
+    print(json.dumps(result, indent=2))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for SemanticIndex's unsummarized_callee_count bookkeeping
+
+Run: python -m unittest test_indexer   (from this directory)
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from indexer import SemanticIndex
+
+
+def recount(conn: sqlite3.Connection) -> dict:
+    """unsummarized_callee_count as it should be, computed from call_edges"""
+    return {
+        row[0]: row[1]
+        for row in conn.execute("""
+            SELECT f.function_id, COUNT(c.function_id)
+            FROM functions f
+            LEFT JOIN call_edges ce
+                ON ce.caller_id = f.function_id AND ce.callee_id != ce.caller_id
+            LEFT JOIN functions c
+                ON c.function_id = ce.callee_id AND c.summary = ''
+            GROUP BY f.function_id
+        """)
+    }
+
+
+def stored(conn: sqlite3.Connection) -> dict:
+    return {
+        row[0]: row[1]
+        for row in conn.execute("SELECT function_id, unsummarized_callee_count FROM functions")
+    }
+
+
+class UnsummarizedCalleeCountTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        os.remove(self.db_path)
+        self.index = SemanticIndex(self.db_path)
+        self.index.init_schema()
+
+    def tearDown(self):
+        self.index.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def assertCounterMatchesRecount(self, conn=None):
+        conn = conn or self.index.conn
+        self.assertEqual(stored(conn), recount(conn))
+
+    def build_graph(self):
+        """a -> b, a -> c, b -> c, c -> c (self call), d -> a"""
+        ids = {name: self.index.add_function(name, "f.c", 1, 2) for name in "abcd"}
+        for caller, callee in ["ab", "ac", "bc", "cc", "da"]:
+            self.index.add_call_edge(ids[caller], ids[callee])
+        return ids
+
+    def test_add_call_edge(self):
+        ids = self.build_graph()
+        self.assertCounterMatchesRecount()
+        self.assertEqual(stored(self.index.conn)[ids["a"]], 2)
+        self.assertEqual(stored(self.index.conn)[ids["c"]], 0)
+        # Duplicate edges are ignored and must not bump the count again
+        self.index.add_call_edge(ids["a"], ids["b"])
+        self.assertCounterMatchesRecount()
+
+    def test_edge_to_summarized_callee(self):
+        ids = self.build_graph()
+        e = self.index.add_function("e", "f.c", summary="already done")
+        self.index.add_call_edge(ids["b"], e)
+        self.assertCounterMatchesRecount()
+
+    def test_update_summary_both_directions(self):
+        ids = self.build_graph()
+        self.index.update_summary(ids["c"], "leaf")
+        self.assertCounterMatchesRecount()
+        self.assertEqual(stored(self.index.conn)[ids["b"]], 0)
+
+        # Re-summarizing an already summarized function changes nothing
+        self.index.update_summary(ids["c"], "leaf, reworded")
+        self.assertCounterMatchesRecount()
+
+        # Clearing a summary blocks its callers again
+        self.index.update_summary(ids["c"], "")
+        self.assertCounterMatchesRecount()
+        self.assertEqual(stored(self.index.conn)[ids["b"]], 1)
+
+    def test_two_connections_update_same_function(self):
+        ids = self.build_graph()
+        other = SemanticIndex(self.db_path)
+        try:
+            self.index.update_summary(ids["c"], "from worker 1")
+            other.update_summary(ids["c"], "from worker 2")
+            self.assertCounterMatchesRecount()
+            self.assertCounterMatchesRecount(other.conn)
+            self.assertEqual(stored(self.index.conn)[ids["a"]], 1)
+            self.assertEqual(stored(self.index.conn)[ids["b"]], 0)
+        finally:
+            other.close()
+
+    def test_raw_sql_writers(self):
+        ids = self.build_graph()
+        with self.index.conn:
+            self.index.conn.execute(
+                "INSERT INTO call_edges (caller_id, callee_id) VALUES (?, ?)", (ids["d"], ids["c"])
+            )
+            self.index.conn.execute("DELETE FROM call_edges WHERE caller_id = ?", (ids["a"],))
+            self.index.conn.execute("UPDATE functions SET summary = 'x' WHERE function_id = ?", (ids["b"],))
+        self.assertCounterMatchesRecount()
+
+        # Deleting a function cascades to its edges; callers stop waiting on it
+        with self.index.conn:
+            self.index.conn.execute("DELETE FROM functions WHERE function_id = ?", (ids["c"],))
+        self.assertCounterMatchesRecount()
+
+    def test_migrate_database_without_counter(self):
+        self.index.close()
+        os.remove(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript("""
+            CREATE TABLE functions (
+                function_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                file TEXT NOT NULL,
+                start_line INTEGER,
+                end_line INTEGER,
+                summary TEXT DEFAULT '',
+                UNIQUE(name, file)
+            );
+            CREATE TABLE call_edges (
+                caller_id INTEGER NOT NULL,
+                callee_id INTEGER NOT NULL,
+                PRIMARY KEY (caller_id, callee_id)
+            );
+            INSERT INTO functions (name, file, summary) VALUES
+                ('a', 'f.c', ''), ('b', 'f.c', ''), ('c', 'f.c', 'done');
+            INSERT INTO call_edges VALUES (1, 2), (1, 3), (2, 2), (3, 1);
+        """)
+        conn.close()
+
+        self.index = SemanticIndex(self.db_path)
+        self.assertCounterMatchesRecount()
+        self.assertEqual(stored(self.index.conn), {1: 1, 2: 0, 3: 1})
+
+        # Triggers are installed, so later writes keep the counter right
+        self.index.update_summary(2, "now done")
+        self.assertCounterMatchesRecount()
+
+    def test_migrate_recounts_drifted_counter(self):
+        self.build_graph()
+        with self.index.conn:
+            for name in ("trg_call_edge_insert", "trg_call_edge_delete",
+                         "trg_function_delete", "trg_function_summary_update"):
+                self.index.conn.execute(f"DROP TRIGGER {name}")
+            self.index.conn.execute("UPDATE functions SET unsummarized_callee_count = -1")
+        self.index.close()
+
+        self.index = SemanticIndex(self.db_path)
+        self.assertCounterMatchesRecount()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Tests for query_repo indexing and call graph construction
+
+Run: python -m unittest test_query_repo   (from this directory)
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import query_repo
+
+
+C_FIXTURE = """\
+int Leaf(int x) { return x; }
+int Shared(int x) { return Leaf(x); }
+"""
+
+
+class ProjectTestCase(unittest.TestCase):
+    """Writes a throwaway project and points query_repo's cache at a temp dir"""
+
+    files = {"fixture.c": C_FIXTURE}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.project = os.path.join(self.tmp, "project")
+        os.makedirs(self.project)
+        for name, text in self.files.items():
+            with open(os.path.join(self.project, name), "w") as f:
+                f.write(text)
+        self._cache_dir = query_repo.CACHE_DIR
+        query_repo.CACHE_DIR = os.path.join(self.tmp, "cache")
+
+    def tearDown(self):
+        query_repo.CACHE_DIR = self._cache_dir
+        shutil.rmtree(self.tmp)
+
+    def init(self, **kwargs):
+        with contextlib.redirect_stderr(io.StringIO()):
+            return query_repo.init(self.project, **kwargs)
+
+
+class InitTest(ProjectTestCase):
+    def test_reindex_after_cache_load(self):
+        self.init()                    # full index, writes the cache
+        self.init()                    # loaded from the cache
+        data = self.init(force_reindex=True)
+        path = os.path.join(self.project, "fixture.c")
+        self.assertIn(path, data["sources"])
+        self.assertEqual(data["function_callees"][path]["Shared"], ["Leaf"])
+
+    def test_cache_load_has_every_key(self):
+        self.init()
+        data = self.init()
+        self.assertEqual(set(data), set(query_repo._empty_project_data()))
+
+
+CYCLE_C_FIXTURE = """\
+int Leaf(int x) { return x; }
+int Shared(int x) { return Leaf(x); }
+int Countdown(int n) { return n ? Countdown(n - 1) : Shared(n); }
+int IsEven(int n);
+int IsOdd(int n) { return n ? IsEven(n - 1) : Shared(0); }
+int IsEven(int n) { return n ? IsOdd(n - 1) : 1; }
+int Root(int n) { return Countdown(n) + IsEven(n) + Shared(n); }
+"""
+
+CYCLE_PY_FIXTURE = """\
+def py_leaf():
+    return 1
+
+def py_fact(n):
+    return n * py_fact(n - 1) if n else py_leaf()
+
+def py_ping(n):
+    return py_pong(n - 1) if n else py_leaf()
+
+def py_pong(n):
+    return py_ping(n - 1) if n else 0
+
+def py_root(n):
+    return py_fact(n) + py_ping(n) + py_leaf()
+"""
+
+CYCLE_STUB = "Already visited (cycle)"
+
+
+def iter_graph(node):
+    """Every node dict in the graph, once per reference"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node["calls"], list):
+            stack.extend(node["calls"])
+
+
+def calls_of(node):
+    return {child["function"]: child for child in node["calls"]}
+
+
+class CallGraphTest(ProjectTestCase):
+    files = {"cycles.c": CYCLE_C_FIXTURE, "cycles.py": CYCLE_PY_FIXTURE}
+
+    def build(self, name):
+        self.init(force_reindex=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return query_repo.build_call_graph(name)
+
+    def assertAcyclicAndShared(self, graph):
+        # Raises ValueError("Circular reference detected") on a reference cycle
+        json.dumps(graph)
+        expanded = {}
+        for node in iter_graph(graph):
+            if isinstance(node["calls"], list):
+                expanded.setdefault(node["function"], set()).add(id(node))
+        # Each function is expanded into a single node dict shared by its callers
+        for name, ids in expanded.items():
+            self.assertEqual(len(ids), 1, name)
+
+    def test_c_direct_and_mutual_recursion(self):
+        graph = self.build("Root")
+        self.assertAcyclicAndShared(graph)
+
+        root_calls = calls_of(graph)
+        self.assertEqual(list(root_calls), ["Countdown", "IsEven", "Shared"])
+        self.assertEqual(calls_of(root_calls["Countdown"])["Countdown"]["calls"], CYCLE_STUB)
+
+        is_odd = calls_of(root_calls["IsEven"])["IsOdd"]
+        self.assertEqual(calls_of(is_odd)["IsEven"]["calls"], CYCLE_STUB)
+
+        # Shared is reached from Countdown, IsOdd and Root but expanded once
+        shared = root_calls["Shared"]
+        self.assertIs(calls_of(root_calls["Countdown"])["Shared"], shared)
+        self.assertIs(calls_of(is_odd)["Shared"], shared)
+        self.assertEqual(calls_of(shared)["Leaf"]["calls"], [])
+
+    def test_python_direct_and_mutual_recursion(self):
+        graph = self.build("py_root")
+        self.assertAcyclicAndShared(graph)
+
+        root_calls = calls_of(graph)
+        self.assertEqual(calls_of(root_calls["py_fact"])["py_fact"]["calls"], CYCLE_STUB)
+        pong = calls_of(root_calls["py_ping"])["py_pong"]
+        self.assertEqual(calls_of(pong)["py_ping"]["calls"], CYCLE_STUB)
+        self.assertIs(calls_of(root_calls["py_fact"])["py_leaf"], root_calls["py_leaf"])
+
+    def test_recursive_root(self):
+        graph = self.build("IsEven")
+        self.assertAcyclicAndShared(graph)
+        self.assertEqual(calls_of(calls_of(graph)["IsOdd"])["IsEven"]["calls"], CYCLE_STUB)
+
+
+def parse_callees(lang, source):
+    """function_callees for one snippet, parsed the way init() parses a file"""
+    saved = query_repo.programming_language
+    query_repo.programming_language = lang
+    try:
+        source = source.encode()
+        tree = query_repo._get_parser(lang).parse(source)
+        return query_repo.walk_once(source, tree)["function_callees"]
+    finally:
+        query_repo.programming_language = saved
+
+
+class CalleeNameTest(unittest.TestCase):
+    """Call names must match how definitions are indexed (bare function name)"""
+
+    def test_c_identifier_and_field_expression(self):
+        callees = parse_callees("c", """\
+void Caller(QUIC_CONNECTION* Connection, struct ops Ops) {
+    Plain(1);
+    Connection->Foo(2);
+    Ops.Bar(3);
+}
+""")
+        self.assertEqual(callees["Caller"], ["Plain", "Foo", "Bar"])
+
+    def test_cpp_qualified_and_template_names(self):
+        callees = parse_callees("cpp", """\
+void Caller() {
+    ::CxPlatEventQDequeue(q);
+    QuicStorageSettingScopeGuard::Create(a);
+    outer::inner::Helper(b);
+    Make<int>(c);
+    std::make_unique<uint8_t[]>(d);
+}
+""")
+        self.assertEqual(
+            callees["Caller"],
+            ["CxPlatEventQDequeue", "Create", "Helper", "Make", "make_unique"]
+        )
+
+    def test_python_attribute_calls(self):
+        callees = parse_callees("python", """\
+def caller(self):
+    plain()
+    self.x()
+    module.sub.helper()
+""")
+        self.assertEqual(callees["caller"], ["plain", "x", "helper"])
+
+    def test_python_nested_def_attribution(self):
+        # Each call belongs to the innermost enclosing function only
+        callees = parse_callees("python", """\
+def outer():
+    before()
+    def inner():
+        nested()
+        def innermost():
+            deepest()
+        return innermost
+    after()
+    return inner
+""")
+        self.assertEqual(callees["outer"], ["before", "after"])
+        self.assertEqual(callees["inner"], ["nested"])
+        self.assertEqual(callees["innermost"], ["deepest"])
+
+
+if __name__ == "__main__":
+    unittest.main()